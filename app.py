@@ -1,11 +1,20 @@
 # dataset-tracker/app.py
 from flask import Flask, render_template, request, jsonify, send_file
+import click
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 import pandas as pd
+import numpy as np
 import io
 import json
+import math
 import os
+import re
+import threading
+import zlib
 
 app = Flask(__name__)
 
@@ -21,6 +30,9 @@ app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-pro
 # Admin user who can approve/reject changes
 ADMIN_USER = os.getenv('ADMIN_USER', 'antoniorodriguez')  # Set via environment variable or default
 
+# Take a catalog snapshot once this many audit entries have accumulated since the last one
+SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', 500))
+
 db = SQLAlchemy(app)
 
 # Load schema configuration
@@ -40,6 +52,8 @@ class Dataset(db.Model):
     training_stage = db.Column(db.Text, nullable=False)
     link = db.Column(db.Text)
     ibm_datapath = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every update; approvals compare-and-swap on it
+    __mapper_args__ = {'version_id_col': version}
 
 class PendingChange(db.Model):
     __tablename__ = 'pending_changes'
@@ -50,7 +64,8 @@ class PendingChange(db.Model):
     new_data = db.Column(db.JSON)
     submitted_by = db.Column(db.String(100))
     submitted_at = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), default='pending')
+    status = db.Column(db.String(20), default='pending')  # pending, approved, rejected or conflict
+    base_version = db.Column(db.Integer)  # Dataset.version the change was diffed against (modify/delete)
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_log'
@@ -71,6 +86,724 @@ class Chart(db.Model):
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
     uploaded_by = db.Column(db.String(100))
 
+class IdCounter(db.Model):
+    __tablename__ = 'id_counters'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class DatasetRollup(db.Model):
+    __tablename__ = 'dataset_rollups'
+    id = db.Column(db.Integer, primary_key=True)
+    training_stage = db.Column(db.Text, nullable=False)
+    domain = db.Column(db.Text, nullable=False, default='')  # '' groups datasets with no domain
+    dataset_count = db.Column(db.Integer, nullable=False, default=0)
+    gemma3_token_cnt = db.Column(db.Float, nullable=False, default=0.0)
+    epoch_token_cnt = db.Column(db.Float, nullable=False, default=0.0)  # sum of gemma3_token_cnt * epochs
+    desired_token_cnt = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (db.UniqueConstraint('training_stage', 'domain', name='uq_rollup_stage_domain'),)
+
+class CatalogSnapshot(db.Model):
+    __tablename__ = 'catalog_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    taken_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    audit_log_id = db.Column(db.Integer, nullable=False, default=0)  # Last audit_log.id reflected in the snapshot
+    row_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed JSON list of serialized datasets
+
+# Dataset ID allocation
+# PostgreSQL allocates from a sequence; other databases fall back to a row in id_counters
+DATASET_ID_SEQUENCE = 'dataset_id_seq'
+DATASET_ID_PATTERN = re.compile(r'^DS-(\d+)$')
+# pg_advisory_xact_lock key serializing nextval/setval on the sequence, held until the upload commits
+ID_ALLOCATOR_LOCK_KEY = 72603
+
+def format_dataset_id(number):
+    return f'DS-{str(number).zfill(6)}'
+
+def max_used_dataset_number():
+    """Highest DS-xxxxxx number used by a dataset or by a pending change"""
+    ids = [row[0] for row in db.session.query(Dataset.dataset_id)]
+    ids += [row[0] for row in db.session.query(PendingChange.dataset_name)]
+    numbers = [int(m.group(1)) for m in map(DATASET_ID_PATTERN.match, filter(None, ids)) if m]
+    return max(numbers, default=0)
+
+# Columns added after the original tables were deployed; create_all() does not add them
+SCHEMA_UPGRADES = [
+    ('datasets', 'version', 'INTEGER NOT NULL DEFAULT 1'),
+    ('pending_changes', 'base_version', 'INTEGER'),
+]
+
+def upgrade_schema():
+    """Add any SCHEMA_UPGRADES column missing from an existing database"""
+    inspector = db.inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table, column, ddl in SCHEMA_UPGRADES:
+            if column not in {c['name'] for c in inspector.get_columns(table)}:
+                conn.execute(db.text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+def lock_id_allocator():
+    """Serialize id allocation and reservation until the current transaction ends (PostgreSQL only).
+
+    setval() is not transactional, so moving the sequence forward must not
+    interleave with another upload's nextval().
+    """
+    if is_postgres():
+        db.session.execute(db.text('SELECT pg_advisory_xact_lock(:key)'), {'key': ID_ALLOCATOR_LOCK_KEY})
+
+def init_id_allocator():
+    """Create the id sequence/counter and move it past every id already in use"""
+    lock_id_allocator()
+    used = max_used_dataset_number()
+    if is_postgres():
+        db.session.execute(db.text(f'CREATE SEQUENCE IF NOT EXISTS {DATASET_ID_SEQUENCE}'))
+        last_value, is_called = db.session.execute(
+            db.text(f'SELECT last_value, is_called FROM {DATASET_ID_SEQUENCE}')
+        ).one()
+        if used > (last_value if is_called else 0):
+            db.session.execute(db.text('SELECT setval(:seq, :value)'), {'seq': DATASET_ID_SEQUENCE, 'value': used})
+    else:
+        counter = db.session.get(IdCounter, 'dataset_id')
+        if not counter:
+            counter = IdCounter(name='dataset_id', value=0)
+            db.session.add(counter)
+        counter.value = max(counter.value, used)
+    db.session.commit()
+
+def allocate_dataset_ids(count, taken=()):
+    """Reserve count new DS-xxxxxx ids, skipping any in taken.
+
+    Sequence values are never handed out twice, so concurrent uploads (and
+    uploads left pending side by side) cannot collide.
+    """
+    lock_id_allocator()
+    allocated = []
+    while len(allocated) < count:
+        needed = count - len(allocated)
+        if is_postgres():
+            numbers = db.session.execute(
+                db.text(f"SELECT nextval('{DATASET_ID_SEQUENCE}') FROM generate_series(1, :n)"), {'n': needed}
+            ).scalars().all()
+        else:
+            counter = IdCounter.query.filter_by(name='dataset_id').with_for_update().first()
+            if not counter:
+                counter = IdCounter(name='dataset_id', value=max_used_dataset_number())
+                db.session.add(counter)
+            numbers = range(counter.value + 1, counter.value + needed + 1)
+            counter.value += needed
+        allocated += [format_dataset_id(n) for n in numbers if format_dataset_id(n) not in taken]
+    return allocated
+
+def reserve_explicit_dataset_ids(dataset_ids):
+    """Move the allocator past explicit DS-xxxxxx ids staged by an upload so it never hands them out"""
+    numbers = [int(m.group(1)) for m in map(DATASET_ID_PATTERN.match, dataset_ids) if m]
+    if not numbers:
+        return
+    highest = max(numbers)
+    lock_id_allocator()
+    if is_postgres():
+        db.session.execute(
+            db.text(f'SELECT setval(:seq, GREATEST(:value, (SELECT last_value FROM {DATASET_ID_SEQUENCE})))'),
+            {'seq': DATASET_ID_SEQUENCE, 'value': highest}
+        )
+    else:
+        counter = IdCounter.query.filter_by(name='dataset_id').with_for_update().first()
+        if not counter:
+            counter = IdCounter(name='dataset_id', value=max_used_dataset_number())
+            db.session.add(counter)
+        counter.value = max(counter.value, highest)
+
+# Search
+# Columns covered by /api/datasets/search
+SEARCH_FIELDS = ['data_name_split', 'link', 'ibm_datapath']
+# Minimum trigram similarity for a fuzzy (non-substring) match
+SEARCH_SIMILARITY_THRESHOLD = 0.3
+SEARCH_MAX_PAGE_SIZE = 200
+# Queries shorter than a trigram only match as prefixes, so they stay index-served
+SEARCH_MIN_SUBSTRING_LENGTH = 3
+# Candidates ranked per PostgreSQL query; total is reported as capped beyond this
+SEARCH_MAX_MATCHES = 1000
+
+def is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+# pg_advisory_lock key serializing init_db() across processes
+INIT_LOCK_KEY = 72601
+
+@contextmanager
+def advisory_lock(key):
+    """Hold a PostgreSQL session-level advisory lock (no-op on other databases)"""
+    if not is_postgres():
+        yield
+        return
+    # Autocommit, so the lock connection never sits idle in a transaction that
+    # CREATE INDEX CONCURRENTLY would wait on
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(db.text('SELECT pg_advisory_lock(:key)'), {'key': key})
+        try:
+            yield
+        finally:
+            conn.execute(db.text('SELECT pg_advisory_unlock(:key)'), {'key': key})
+
+def init_search_index():
+    """Create pg_trgm and the indexes used by search (PostgreSQL only).
+
+    lower(field) text_pattern_ops indexes serve prefix matches, trigram GIN
+    indexes serve ILIKE substring matches and trigram GiST indexes serve
+    nearest-first fuzzy matches (field <-> q). Indexes are built CONCURRENTLY
+    so the datasets table stays writable; a build interrupted earlier leaves an
+    invalid index, which is dropped and rebuilt.
+    """
+    if not is_postgres():
+        return
+    indexes = {}
+    for field in SEARCH_FIELDS:
+        indexes[f'ix_datasets_{field}_prefix'] = f'(lower({field}) text_pattern_ops)'
+        indexes[f'ix_datasets_{field}_trgm'] = f'USING gin ({field} gin_trgm_ops)'
+        indexes[f'ix_datasets_{field}_trgm_gist'] = f'USING gist ({field} gist_trgm_ops)'
+
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        invalid = conn.execute(db.text(
+            'SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid '
+            'WHERE NOT i.indisvalid AND c.relname = ANY(:names)'
+        ), {'names': list(indexes)}).scalars().all()
+        for name in invalid:
+            conn.execute(db.text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        for name, definition in indexes.items():
+            conn.execute(db.text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON datasets {definition}'))
+
+def trigrams(text):
+    """Trigram set of a string, padded the same way pg_trgm pads words"""
+    padded = f'  {text.lower()} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def match_score(query, value):
+    """Rank a single field value: prefix > substring > fuzzy, 0 if no match"""
+    if not value:
+        return 0.0
+    value = value.lower()
+    if value.startswith(query):
+        return 3.0
+    if query in value:
+        return 2.0
+    query_grams, value_grams = trigrams(query), trigrams(value)
+    similarity = len(query_grams & value_grams) / len(query_grams | value_grams)
+    return similarity if similarity >= SEARCH_SIMILARITY_THRESHOLD else 0.0
+
+class InProcessSearchIndex:
+    """Trigram inverted index over SEARCH_FIELDS, used when the database is not PostgreSQL.
+
+    The index is rebuilt lazily on the next search after invalidate() is called.
+    Rows are cached as serialized dicts, not ORM instances.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stale = True
+        self._rows = {}
+        self._postings = {}
+
+    def invalidate(self):
+        # Taking the lock means an invalidation during a rebuild lands after it, not before
+        with self._lock:
+            self._stale = True
+
+    def _rebuild(self):
+        rows = {}
+        postings = {}
+        for d in Dataset.query.all():
+            rows[d.id] = serialize_dataset(d)
+            for field in SEARCH_FIELDS:
+                for gram in trigrams(getattr(d, field) or ''):
+                    postings.setdefault(gram, set()).add(d.id)
+        self._rows = rows
+        self._postings = postings
+        self._stale = False
+
+    def search(self, query, offset, limit):
+        query = query.lower()
+        with self._lock:
+            if self._stale:
+                self._rebuild()
+            rows, postings = self._rows, self._postings
+
+        if len(query) < SEARCH_MIN_SUBSTRING_LENGTH:
+            # Short queries are prefix-only: the leading padded trigram ("  a" / " ab") finds them
+            candidates = postings.get(('  ' + query)[-3:], set())
+            score_fn = lambda value: 3.0 if value and value.lower().startswith(query) else 0.0
+        else:
+            # Any row matching by prefix, substring or similarity shares at least one trigram
+            candidates = set()
+            for gram in trigrams(query):
+                candidates |= postings.get(gram, set())
+            score_fn = lambda value: match_score(query, value)
+
+        scored = []
+        for row_id in candidates:
+            row = rows[row_id]
+            score = max(score_fn(row[field]) for field in SEARCH_FIELDS)
+            if score > 0:
+                scored.append((score, row['data_name_split'] or '', row))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+        return len(scored), False, [(score, row) for score, _, row in scored[offset:offset + limit]]
+
+search_index = InProcessSearchIndex()
+
+def search_postgres(query, offset, limit):
+    """Rank with pg_trgm over at most SEARCH_MAX_MATCHES candidates gathered in rank order.
+
+    Each tier only fills what the previous ones left: prefix matches
+    (lower(field) LIKE 'q%', text_pattern_ops indexes), then substring matches
+    (ILIKE, trigram GIN indexes), then fuzzy matches nearest first
+    (field <-> q, trigram GiST indexes). Queries shorter than
+    SEARCH_MIN_SUBSTRING_LENGTH use the prefix tier only. If a tier overflows
+    the cap, which of its equally-ranked rows are kept is arbitrary.
+    """
+    escaped = query.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    prefix = f'{escaped}%'
+    pattern = f'%{escaped}%'
+    candidates = {}  # id -> (score, data_name_split)
+    capped = False
+
+    def remaining():
+        return SEARCH_MAX_MATCHES - len(candidates)
+
+    def not_found():
+        return ~Dataset.id.in_(list(candidates)) if candidates else db.true()
+
+    def collect(rows):
+        # rows are (id, data_name_split, score) in rank order, fetched with limit remaining() + 1
+        nonlocal capped
+        room = remaining()
+        if len(rows) > room:
+            capped = True
+        for row_id, name, score in rows[:room]:
+            candidates[row_id] = (score, name)
+
+    collect(db.session.execute(
+        db.select(Dataset.id, Dataset.data_name_split, db.literal(3.0))
+        .where(db.or_(*[db.func.lower(getattr(Dataset, field)).like(prefix) for field in SEARCH_FIELDS]))
+        .limit(remaining() + 1)
+    ).all())
+
+    if len(query) >= SEARCH_MIN_SUBSTRING_LENGTH and not capped:
+        collect(db.session.execute(
+            db.select(Dataset.id, Dataset.data_name_split, db.literal(2.0))
+            .where(db.or_(*[getattr(Dataset, field).ilike(pattern) for field in SEARCH_FIELDS]), not_found())
+            .limit(remaining() + 1)
+        ).all())
+
+    if len(query) >= SEARCH_MIN_SUBSTRING_LENGTH and not capped:
+        # One KNN scan per field, merged by each row's best (smallest) distance
+        nearest = {}
+        for field in SEARCH_FIELDS:
+            column = getattr(Dataset, field)
+            distance = column.op('<->')(query)
+            for row_id, name, dist in db.session.execute(
+                db.select(Dataset.id, Dataset.data_name_split, distance)
+                .where(column.op('%')(query), not_found())
+                .order_by(distance)
+                .limit(remaining() + 1)
+            ):
+                if row_id not in nearest or dist < nearest[row_id][1]:
+                    nearest[row_id] = (name, dist)
+        ranked = sorted(nearest.items(), key=lambda item: item[1][1])
+        collect([(row_id, name, 1.0 - dist) for row_id, (name, dist) in ranked])
+
+    ordered = sorted(candidates.items(), key=lambda item: (-item[1][0], item[1][1] or ''))
+    page = ordered[offset:offset + limit]
+    rows = {d.id: d for d in Dataset.query.filter(Dataset.id.in_([row_id for row_id, _ in page]))}
+    # A row deleted since the candidate queries simply drops out of the page
+    return len(candidates), capped, [
+        (score, serialize_dataset(rows[row_id])) for row_id, (score, _) in page if row_id in rows
+    ]
+
+# Rollups
+ROLLUP_SUM_FIELDS = ['gemma3_token_cnt', 'epoch_token_cnt', 'desired_token_cnt']
+
+def to_number(value):
+    """Best-effort float conversion for values that may still be raw CSV strings"""
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def rollup_contribution(d):
+    """(group key, contribution) of one dataset row, matching SQL SUM semantics for NULLs"""
+    tokens = to_number(d.gemma3_token_cnt)
+    epochs = to_number(d.epochs)
+    desired = to_number(d.desired_token_cnt)
+    key = (d.training_stage, d.domain or '')
+    return key, {
+        'dataset_count': 1,
+        'gemma3_token_cnt': tokens or 0.0,
+        'epoch_token_cnt': tokens * epochs if tokens is not None and epochs is not None else 0.0,
+        'desired_token_cnt': desired or 0.0
+    }
+
+def add_rollup_delta(deltas, d, sign):
+    """Accumulate +/- one dataset's contribution into a {group key: totals} dict"""
+    key, contribution = rollup_contribution(d)
+    totals = deltas.setdefault(key, {'dataset_count': 0, **{f: 0.0 for f in ROLLUP_SUM_FIELDS}})
+    for field, value in contribution.items():
+        totals[field] += sign * value
+
+def merge_rollup_deltas(into, deltas):
+    """Add one {group key: totals} dict into another"""
+    for key, totals in deltas.items():
+        target = into.setdefault(key, {'dataset_count': 0, **{f: 0.0 for f in ROLLUP_SUM_FIELDS}})
+        for field, value in totals.items():
+            target[field] += value
+
+def apply_rollup_deltas(deltas):
+    """Apply accumulated deltas to dataset_rollups in the current transaction"""
+    for (training_stage, domain), totals in deltas.items():
+        if totals['dataset_count'] == 0 and not any(totals[f] for f in ROLLUP_SUM_FIELDS):
+            continue
+        rollup = (
+            DatasetRollup.query
+            .filter_by(training_stage=training_stage, domain=domain)
+            .with_for_update()
+            .first()
+        )
+        is_new = not rollup
+        if is_new:
+            rollup = DatasetRollup(training_stage=training_stage, domain=domain, dataset_count=0,
+                                   **{f: 0.0 for f in ROLLUP_SUM_FIELDS})
+            db.session.add(rollup)
+        rollup.dataset_count += totals['dataset_count']
+        for field in ROLLUP_SUM_FIELDS:
+            setattr(rollup, field, getattr(rollup, field) + totals[field])
+        if rollup.dataset_count <= 0:
+            # A row created just now was never persisted, so drop it from the session instead
+            if is_new:
+                db.session.expunge(rollup)
+            else:
+                db.session.delete(rollup)
+
+def compute_rollups():
+    """Full GROUP BY recompute of the rollups from the datasets table"""
+    domain = db.func.coalesce(Dataset.domain, '')
+    rows = (
+        db.session.query(
+            Dataset.training_stage,
+            domain,
+            db.func.count(Dataset.id),
+            db.func.coalesce(db.func.sum(Dataset.gemma3_token_cnt), 0.0),
+            db.func.coalesce(db.func.sum(Dataset.gemma3_token_cnt * Dataset.epochs), 0.0),
+            db.func.coalesce(db.func.sum(Dataset.desired_token_cnt), 0.0)
+        )
+        .group_by(Dataset.training_stage, domain)
+        .all()
+    )
+    return {
+        (stage, dom): {
+            'dataset_count': count,
+            'gemma3_token_cnt': float(tokens),
+            'epoch_token_cnt': float(epoch_tokens),
+            'desired_token_cnt': float(desired)
+        }
+        for stage, dom, count, tokens, epoch_tokens, desired in rows
+    }
+
+def rebuild_rollups():
+    """Replace dataset_rollups with a full recompute (backfill / repair)"""
+    DatasetRollup.query.delete()
+    for (training_stage, domain), totals in compute_rollups().items():
+        db.session.add(DatasetRollup(training_stage=training_stage, domain=domain, **totals))
+    db.session.commit()
+
+def serialize_rollup(r):
+    return {
+        'training_stage': r.training_stage,
+        'domain': r.domain,
+        'dataset_count': r.dataset_count,
+        'gemma3_token_cnt': r.gemma3_token_cnt,
+        'epoch_token_cnt': r.epoch_token_cnt,
+        'desired_token_cnt': r.desired_token_cnt
+    }
+
+# Snapshots
+# pg_advisory_lock key: approvals hold it shared, snapshots take it exclusively to fix their watermark
+SNAPSHOT_LOCK_KEY = 72602
+SNAPSHOT_BATCH_SIZE = 5000
+
+def lock_for_approval():
+    """Hold the snapshot lock shared until the approval transaction ends (PostgreSQL only)"""
+    if is_postgres():
+        db.session.execute(db.text('SELECT pg_advisory_xact_lock_shared(:key)'), {'key': SNAPSHOT_LOCK_KEY})
+
+def take_snapshot():
+    """Write and commit a compressed snapshot of the datasets table.
+
+    The watermark (last audit_log.id reflected) must not skip an approval that
+    was still in flight. On PostgreSQL the snapshot takes the snapshot lock
+    exclusively, which waits for running approvals to commit. It then pins a
+    REPEATABLE READ view with its first query and releases the lock at once,
+    so approvals are only held up for that one query. Rows are then streamed
+    and compressed in batches rather than loaded all at once.
+    """
+    options = {'isolation_level': 'REPEATABLE READ'} if is_postgres() else {}
+    with db.engine.connect().execution_options(**options) as conn:
+        with advisory_lock(SNAPSHOT_LOCK_KEY):
+            taken_at = datetime.utcnow()
+            watermark = conn.execute(db.select(db.func.max(AuditLog.id))).scalar() or 0
+
+        fields = list(serialize_dataset(Dataset()))
+        compressor = zlib.compressobj()
+        chunks = [compressor.compress(b'[')]
+        row_count = 0
+        result = conn.execution_options(yield_per=SNAPSHOT_BATCH_SIZE).execute(
+            db.select(*[Dataset.__table__.c[f] for f in fields]).order_by(Dataset.id)
+        )
+        for row in result.mappings():
+            chunks.append(compressor.compress((b',' if row_count else b'') + json.dumps(dict(row)).encode()))
+            row_count += 1
+        chunks.append(compressor.compress(b']'))
+        chunks.append(compressor.flush())
+
+    snapshot = CatalogSnapshot(
+        taken_at=taken_at,
+        audit_log_id=watermark,
+        row_count=row_count,
+        data=b''.join(chunks)
+    )
+    db.session.add(snapshot)
+    db.session.commit()
+    return snapshot
+
+def snapshot_due():
+    """True if there is no snapshot yet or SNAPSHOT_INTERVAL audit entries were written since the latest"""
+    latest = CatalogSnapshot.query.order_by(CatalogSnapshot.audit_log_id.desc()).first()
+    return not latest or AuditLog.query.filter(AuditLog.id > latest.audit_log_id).count() >= SNAPSHOT_INTERVAL
+
+def parse_as_of(value):
+    """Parse an ISO date/datetime into naive UTC; a bare date means the end of that day"""
+    as_of = datetime.fromisoformat(value)
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+    elif len(value) == 10:
+        as_of = as_of + timedelta(days=1) - timedelta(microseconds=1)
+    return as_of
+
+def normalize_row(row):
+    """Coerce number columns of a replayed row the same way the datasets table stores them"""
+    for col in SCHEMA_CONFIG['columns']:
+        if col['type'] == 'number' and col['db_field'] in row:
+            row[col['db_field']] = to_number(row[col['db_field']])
+    return row
+
+def historical_row(values):
+    """A replayed row with every serialized field present and number columns typed"""
+    row = dict.fromkeys(serialize_dataset(Dataset()), None)
+    row.update(values)
+    return normalize_row(row)
+
+def datasets_as_of(as_of):
+    """Rebuild the datasets table as of a point in time.
+
+    Starts from the newest snapshot taken at or before as_of and replays the
+    audit entries written after it. For an as_of before the first snapshot, it
+    starts from that snapshot and undoes, newest first, the audit entries it
+    already reflects that were written after as_of. Returns None if there are no
+    snapshots at all. Rows carry no database id, since replayed adds never had one.
+    """
+    snapshot = (
+        CatalogSnapshot.query
+        .filter(CatalogSnapshot.taken_at <= as_of)
+        .order_by(CatalogSnapshot.taken_at.desc())
+        .first()
+    )
+    forward = snapshot is not None
+    if not forward:
+        snapshot = CatalogSnapshot.query.order_by(CatalogSnapshot.taken_at).first()
+        if not snapshot:
+            return None
+
+    rows = {row['dataset_id']: row for row in json.loads(zlib.decompress(snapshot.data))}
+
+    if forward:
+        entries = (
+            AuditLog.query
+            .filter(AuditLog.id > snapshot.audit_log_id, AuditLog.changed_at <= as_of)
+            .order_by(AuditLog.id)
+            .all()
+        )
+        for entry in entries:
+            changes = entry.changes or {}
+            if entry.action == 'add':
+                rows[entry.dataset_name] = historical_row(changes.get('new_data', {}))
+            elif entry.action == 'modify' and entry.dataset_name in rows:
+                rows[entry.dataset_name].update(normalize_row(dict(changes.get('new', {}))))
+            elif entry.action == 'delete':
+                rows.pop(entry.dataset_name, None)
+    else:
+        entries = (
+            AuditLog.query
+            .filter(AuditLog.id <= snapshot.audit_log_id, AuditLog.changed_at > as_of)
+            .order_by(AuditLog.id.desc())
+            .all()
+        )
+        for entry in entries:
+            changes = entry.changes or {}
+            if entry.action == 'add':
+                rows.pop(entry.dataset_name, None)
+            elif entry.action == 'modify' and entry.dataset_name in rows:
+                rows[entry.dataset_name].update(normalize_row(dict(changes.get('old', {}))))
+            elif entry.action == 'delete':
+                # Entries from before typed uploads stored missing text values as the string 'None'
+                deleted = {k: None if v == 'None' else v for k, v in changes.get('deleted_data', {}).items()}
+                rows[entry.dataset_name] = historical_row(deleted)
+
+    for row in rows.values():
+        row.pop('id', None)
+    return list(rows.values())
+
+def serialize_snapshot(s):
+    return {
+        'id': s.id,
+        'taken_at': s.taken_at.isoformat(),
+        'audit_log_id': s.audit_log_id,
+        'row_count': s.row_count,
+        'compressed_bytes': len(s.data)
+    }
+
+def historical_rows():
+    """Rows for the ?as_of= parameter: (rows, None) on success, (None, error response) otherwise"""
+    try:
+        as_of = parse_as_of(request.args['as_of'])
+    except ValueError:
+        return None, (jsonify({'error': 'as_of must be an ISO 8601 date or datetime'}), 400)
+
+    rows = datasets_as_of(as_of)
+    if rows is None:
+        return None, (jsonify({'error': 'No catalog snapshot exists yet; run flask --app app init-db'}), 404)
+    return rows, None
+
+# Validation
+def typed_value(col, value):
+    """Coerce a single value to the type stored for a SCHEMA_CONFIG column (None when empty)"""
+    if col['type'] == 'number':
+        return to_number(value)
+    if value is None or pd.isna(value) or str(value).strip() == '':
+        return None
+    return str(value).strip()
+
+def typed_dataset_values(d):
+    """Schema fields of a Dataset, typed the same way validate_upload types uploaded rows"""
+    return {col['db_field']: typed_value(col, getattr(d, col['db_field'], None)) for col in SCHEMA_CONFIG['columns']}
+
+def validate_upload(df):
+    """Check types, required fields and duplicate dataset_ids across a whole uploaded frame.
+
+    Accepts either display names or db field names as CSV headers. Returns
+    (records, errors, invalid_ids): typed dicts for valid rows, one report per
+    invalid row (with its CSV line number), and the dataset_ids of invalid rows.
+    """
+    # Blank lines were kept so that index + 2 is the CSV line number; drop them now
+    df = df.dropna(how='all')
+    frame = pd.DataFrame(index=df.index)
+    errors_by_row = {}
+
+    def flag(mask, message):
+        # message is either a constant or a per-row Series of messages
+        for idx in mask[mask].index:
+            errors_by_row.setdefault(idx, []).append(
+                message.at[idx] if isinstance(message, pd.Series) else message
+            )
+
+    for col in SCHEMA_CONFIG['columns']:
+        csv_name, db_field = col['name'], col['db_field']
+        source = csv_name if csv_name in df.columns else db_field
+        if source in df.columns:
+            text = df[source].astype('string').str.strip()
+            text = text.mask(text == '')
+        else:
+            text = pd.Series(pd.NA, index=df.index, dtype='string')
+
+        if col['type'] == 'number':
+            frame[db_field] = pd.to_numeric(text, errors='coerce').astype('float64')
+            # to_numeric accepts inf / 1e400, which JSON and the pending_changes column cannot hold
+            flag(text.notna() & ~np.isfinite(frame[db_field]), f'{csv_name}: expected a finite number, got "' + text + '"')
+        else:
+            frame[db_field] = text
+
+        # dataset_id is generated for new rows, so it is the one required field allowed to be blank
+        if col.get('required') and db_field != 'dataset_id':
+            flag(frame[db_field].isna(), f'{csv_name}: required value is missing')
+
+    ids = frame['dataset_id']
+    flag(ids.notna() & ids.duplicated(keep=False), 'Dataset ID: duplicated in this upload')
+
+    frame = frame.astype(object).where(frame.notna(), None)
+    errors = [{
+        'row': int(idx) + 2,  # 1-based CSV line number, counting the header
+        'dataset_id': frame.at[idx, 'dataset_id'],
+        'data_name_split': frame.at[idx, 'data_name_split'],
+        'errors': messages
+    } for idx, messages in sorted(errors_by_row.items())]
+
+    records = frame.loc[~frame.index.isin(list(errors_by_row))].to_dict('records')
+    invalid_ids = {e['dataset_id'] for e in errors if e['dataset_id']}
+    return records, errors, invalid_ids
+
+def serialize_dataset(d):
+    return {
+        'id': d.id,
+        'dataset_id': d.dataset_id,
+        'data_name_split': d.data_name_split,
+        'domain': d.domain,
+        'gemma3_token_cnt': d.gemma3_token_cnt,
+        'epochs': d.epochs,
+        'desired_token_cnt': d.desired_token_cnt,
+        'training_stage': d.training_stage,
+        'link': d.link,
+        'ibm_datapath': d.ibm_datapath
+    }
+
+# Startup
+def init_db():
+    """Idempotent schema, index and bootstrap setup.
+
+    Run as the deploy/release step (flask --app app init-db), not per request:
+    index builds and backfills can take minutes on a large catalog. Concurrent
+    runs are serialized with an advisory lock.
+    """
+    with advisory_lock(INIT_LOCK_KEY):
+        _init_db()
+
+def _init_db():
+    db.create_all()
+    upgrade_schema()
+    init_id_allocator()
+    init_search_index()
+    # Backfill rollups the first time the table is created on an existing catalog
+    if not DatasetRollup.query.first() and Dataset.query.first():
+        rebuild_rollups()
+    # Baseline snapshot; history before it is reconstructed by undoing audit entries
+    if not CatalogSnapshot.query.first():
+        take_snapshot()
+
+@app.cli.command('snapshot')
+@click.option('--force', is_flag=True, help='Snapshot even if SNAPSHOT_INTERVAL has not been reached')
+def snapshot_command(force):
+    """Take a catalog snapshot if one is due (flask --app app snapshot); run on a schedule"""
+    if force or snapshot_due():
+        snapshot = take_snapshot()
+        print(f'Snapshot {snapshot.id}: {snapshot.row_count} rows up to audit entry {snapshot.audit_log_id}')
+    else:
+        print('No snapshot due')
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create tables, indexes and bootstrap data (flask --app app init-db)"""
+    init_db()
+    print('Database initialized')
+
 # Routes
 @app.route('/')
 def index():
@@ -79,36 +812,62 @@ def index():
 @app.route('/api/datasets')
 def get_datasets():
     try:
+        if request.args.get('as_of'):
+            rows, error = historical_rows()
+            return error or jsonify(rows)
+
         datasets = Dataset.query.all()
-        return jsonify([{
-            'id': d.id,
-            'dataset_id': d.dataset_id,
-            'data_name_split': d.data_name_split,
-            'domain': d.domain,
-            'gemma3_token_cnt': d.gemma3_token_cnt,
-            'epochs': d.epochs,
-            'desired_token_cnt': d.desired_token_cnt,
-            'training_stage': d.training_stage,
-            'link': d.link,
-            'ibm_datapath': d.ibm_datapath
-        } for d in datasets])
+        return jsonify([serialize_dataset(d) for d in datasets])
     except Exception as e:
         print(f"ERROR: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/datasets/search')
+def search_datasets():
+    """Prefix, substring and fuzzy search over dataset names, links and IBM datapaths"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query parameter "q"'}), 400
+
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('page_size', 50)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'page and page_size must be integers'}), 400
+
+    offset = (page - 1) * page_size
+    if is_postgres():
+        total, capped, results = search_postgres(query, offset, page_size)
+    else:
+        total, capped, results = search_index.search(query, offset, page_size)
+
+    return jsonify({
+        'query': query,
+        'page': page,
+        'page_size': page_size,
+        'total': total,
+        'total_capped': capped,  # True when more than `total` rows match; refine the query
+        'results': [dict(row, score=float(score)) for score, row in results]
+    })
+
 @app.route('/api/download')
 def download_csv():
-    datasets = Dataset.query.all()
+    if request.args.get('as_of'):
+        rows, error = historical_rows()
+        if error:
+            return error
+    else:
+        rows = [serialize_dataset(d) for d in Dataset.query.all()]
     
     columns = [col['name'] for col in SCHEMA_CONFIG['columns']]
     data = []
     
-    for d in datasets:
+    for d in rows:
         row = []
         for col in SCHEMA_CONFIG['columns']:
-            row.append(getattr(d, col['db_field'], ''))
+            row.append(d.get(col['db_field'], ''))
         data.append(row)
     
     df = pd.DataFrame(data, columns=columns)
@@ -134,67 +893,46 @@ def upload_csv():
     upload_mode = request.form.get('upload_mode', 'add')
     
     try:
-        df = pd.read_csv(file)
+        # Keep blank lines as empty rows so row indexes map to CSV line numbers
+        df = pd.read_csv(file, dtype=str, skip_blank_lines=False)
 
         # Debug: Log the columns found in the CSV
         print(f"CSV columns found: {list(df.columns)}")
         print(f"CSV has {len(df)} rows")
 
+        records, errors, invalid_ids = validate_upload(df)
+
         # Get current datasets by dataset_id (the custom ID like DS-000001)
         current_datasets_by_id = {d.dataset_id: d for d in Dataset.query.all()}
         
-        # Get max database id for generating new dataset_ids
-        max_db_id = db.session.query(db.func.max(Dataset.id)).scalar() or 0
-        next_id_counter = max_db_id + 1
-        
         diff = {
             'added': [],
             'modified': [],
             'deleted': []
         }
         
-        uploaded_ids = set()
+        # Rows that failed validation are neither modified nor treated as missing in replace mode
+        uploaded_ids = set(invalid_ids)
         
-        for _, row in df.iterrows():
-            # Get or generate dataset_id - try both display name and db field name
-            dataset_id = None
-            for possible_name in ['Dataset ID', 'dataset_id']:
-                if possible_name in row and not pd.isna(row[possible_name]):
-                    dataset_id = row[possible_name]
-                    break
-
-            if not dataset_id:
-                dataset_id = f'DS-{str(next_id_counter).zfill(6)}'
-                next_id_counter += 1
-
-            # Get dataset name - try both display name and db field name
-            dataset_name = None
-            for possible_name in ['Data Name Split', 'data_name_split']:
-                if possible_name in row and not pd.isna(row[possible_name]):
-                    dataset_name = row[possible_name]
-                    break
-
-            if not dataset_name:
-                continue
-
-            uploaded_ids.add(dataset_id)
-
-            new_data = {}
-            for col in SCHEMA_CONFIG['columns']:
-                csv_name = col['name']
-                db_field = col['db_field']
+        # Generated ids must not collide with existing rows, pending adds or ids supplied in this upload;
+        # taking the allocator lock first keeps another upload from staging ids in between
+        lock_id_allocator()
+        explicit_ids = {r['dataset_id'] for r in records if r['dataset_id']} | invalid_ids
+        pending_add_ids = {
+            row[0] for row in db.session.query(PendingChange.dataset_name)
+            .filter_by(change_type='add', status='pending')
+        }
+        taken_ids = set(current_datasets_by_id) | pending_add_ids | explicit_ids
+        new_ids = iter(allocate_dataset_ids(sum(1 for r in records if not r['dataset_id']), taken_ids))
+        reserve_explicit_dataset_ids(explicit_ids - set(current_datasets_by_id))
 
-                if db_field == 'dataset_id':
-                    new_data[db_field] = str(dataset_id)
-                else:
-                    # Try to get value using both display name and db field name
-                    value = None
-                    if csv_name in row:
-                        value = row[csv_name]
-                    elif db_field in row:
-                        value = row[db_field]
+        for new_data in records:
+            if not new_data['dataset_id']:
+                new_data['dataset_id'] = next(new_ids)
 
-                    new_data[db_field] = '' if pd.isna(value) else str(value)
+            dataset_id = new_data['dataset_id']
+            dataset_name = new_data['data_name_split']
+            uploaded_ids.add(dataset_id)
 
             # Debug: Log first row to verify data is being read correctly
             if len(diff['added']) == 0 and len(diff['modified']) == 0:
@@ -202,15 +940,13 @@ def upload_csv():
 
             if dataset_id in current_datasets_by_id:
                 old_dataset = current_datasets_by_id[dataset_id]
-                old_data = {
-                    col['db_field']: str(getattr(old_dataset, col['db_field'], ''))
-                    for col in SCHEMA_CONFIG['columns']
-                }
+                old_data = typed_dataset_values(old_dataset)
                 
                 if old_data != new_data:
                     diff['modified'].append({
                         'dataset_id': dataset_id,
                         'data_name_split': dataset_name,
+                        'base_version': old_dataset.version,
                         'old': old_data,
                         'new': new_data
                     })
@@ -225,13 +961,11 @@ def upload_csv():
             for dataset_id in current_datasets_by_id:
                 if dataset_id not in uploaded_ids:
                     old_dataset = current_datasets_by_id[dataset_id]
-                    old_data = {
-                        col['db_field']: str(getattr(old_dataset, col['db_field'], ''))
-                        for col in SCHEMA_CONFIG['columns']
-                    }
+                    old_data = typed_dataset_values(old_dataset)
                     diff['deleted'].append({
                         'dataset_id': dataset_id,
                         'data_name_split': old_dataset.data_name_split,
+                        'base_version': old_dataset.version,
                         'data': old_data
                     })
         
@@ -250,7 +984,8 @@ def upload_csv():
                 dataset_name=item['dataset_id'],
                 old_data=item['old'],
                 new_data=item['new'],
-                submitted_by=submitted_by
+                submitted_by=submitted_by,
+                base_version=item['base_version']
             )
             db.session.add(change)
         
@@ -259,23 +994,26 @@ def upload_csv():
                 change_type='delete',
                 dataset_name=item['dataset_id'],
                 old_data=item['data'],
-                submitted_by=submitted_by
+                submitted_by=submitted_by,
+                base_version=item['base_version']
             )
             db.session.add(change)
         
         db.session.commit()
 
         # Debug: Log the summary
-        print(f"Upload summary - Added: {len(diff['added'])}, Modified: {len(diff['modified'])}, Deleted: {len(diff['deleted'])}")
+        print(f"Upload summary - Added: {len(diff['added'])}, Modified: {len(diff['modified'])}, Deleted: {len(diff['deleted'])}, Invalid: {len(errors)}")
 
         return jsonify({
             'success': True,
             'diff': diff,
             'upload_mode': upload_mode,
+            'errors': errors,
             'summary': {
                 'added': len(diff['added']),
                 'modified': len(diff['modified']),
-                'deleted': len(diff['deleted'])
+                'deleted': len(diff['deleted']),
+                'invalid': len(errors)
             }
         })
     
@@ -321,6 +1059,62 @@ def get_pending():
     
     return jsonify(result)
 
+def apply_change(change, dataset, approved_by, rollup_deltas):
+    """Apply one approved pending change to the (locked) dataset row and write its audit entry"""
+    if change.change_type == 'add':
+        new_dataset = Dataset()
+        for key, value in normalize_row(dict(change.new_data)).items():
+            setattr(new_dataset, key, value)
+        db.session.add(new_dataset)
+        add_rollup_delta(rollup_deltas, new_dataset, 1)
+
+        audit = AuditLog(
+            action='add',
+            dataset_name=change.dataset_name,
+            changed_by=approved_by,
+            changes={'new_data': change.new_data}
+        )
+        db.session.add(audit)
+
+    elif change.change_type == 'modify':
+        add_rollup_delta(rollup_deltas, dataset, -1)
+        old_values = {}
+        for key, value in normalize_row(dict(change.new_data)).items():
+            old_values[key] = getattr(dataset, key, None)
+            setattr(dataset, key, value)
+        add_rollup_delta(rollup_deltas, dataset, 1)
+
+        audit = AuditLog(
+            action='modify',
+            dataset_name=change.dataset_name,
+            changed_by=approved_by,
+            changes={'old': old_values, 'new': change.new_data}
+        )
+        db.session.add(audit)
+
+    elif change.change_type == 'delete':
+        add_rollup_delta(rollup_deltas, dataset, -1)
+        db.session.delete(dataset)
+
+        audit = AuditLog(
+            action='delete',
+            dataset_name=change.dataset_name,
+            changed_by=approved_by,
+            changes={'deleted_data': change.old_data}
+        )
+        db.session.add(audit)
+
+def change_conflict(change, dataset):
+    """Why a pending change can no longer be applied to the current row, or None if it can"""
+    if change.change_type == 'add':
+        return 'dataset_id already exists' if dataset else None
+    if not dataset:
+        return 'dataset no longer exists'
+    # Changes staged before versioning carry no base_version and are applied as before
+    if change.base_version is not None and dataset.version != change.base_version:
+        return f'dataset changed since upload (version {change.base_version} -> {dataset.version})'
+    return None
+
 @app.route('/api/approve', methods=['POST'])
 def approve_changes():
     data = request.json
@@ -335,58 +1129,53 @@ def approve_changes():
         }), 403
 
     try:
+        lock_for_approval()
+        rollup_deltas = {}
+        approved = 0
+        conflicts = []
         for change_id in change_ids:
             change = PendingChange.query.get(change_id)
             if not change or change.status != 'pending':
                 continue
-            
-            if change.change_type == 'add':
-                new_dataset = Dataset()
-                for key, value in change.new_data.items():
-                    setattr(new_dataset, key, value)
-                db.session.add(new_dataset)
-                
-                audit = AuditLog(
-                    action='add',
-                    dataset_name=change.dataset_name,
-                    changed_by=approved_by,
-                    changes={'new_data': change.new_data}
-                )
-                db.session.add(audit)
-                
-            elif change.change_type == 'modify':
-                dataset = Dataset.query.filter_by(dataset_id=change.dataset_name).first()
-                if dataset:
-                    old_values = {}
-                    for key, value in change.new_data.items():
-                        old_values[key] = getattr(dataset, key, None)
-                        setattr(dataset, key, value)
-                    
-                    audit = AuditLog(
-                        action='modify',
-                        dataset_name=change.dataset_name,
-                        changed_by=approved_by,
-                        changes={'old': old_values, 'new': change.new_data}
-                    )
-                    db.session.add(audit)
-                    
-            elif change.change_type == 'delete':
-                dataset = Dataset.query.filter_by(dataset_id=change.dataset_name).first()
-                if dataset:
-                    db.session.delete(dataset)
-                    
-                    audit = AuditLog(
-                        action='delete',
-                        dataset_name=change.dataset_name,
-                        changed_by=approved_by,
-                        changes={'deleted_data': change.old_data}
+
+            # Apply each change in a savepoint so a unique-key or version race turns into a
+            # conflict for that change instead of rolling back the whole batch
+            change_deltas = {}
+            try:
+                with db.session.begin_nested():
+                    # Lock the target row so the version check below is a compare-and-swap
+                    dataset = (
+                        Dataset.query
+                        .filter_by(dataset_id=change.dataset_name)
+                        .with_for_update()
+                        .first()
                     )
-                    db.session.add(audit)
-            
+                    conflict = change_conflict(change, dataset)
+                    if not conflict:
+                        apply_change(change, dataset, approved_by, change_deltas)
+            except IntegrityError:
+                conflict = 'dataset_id already exists'
+            except StaleDataError:
+                conflict = 'dataset changed concurrently during approval'
+
+            if conflict:
+                change.status = 'conflict'
+                conflicts.append({
+                    'id': change.id,
+                    'change_type': change.change_type,
+                    'dataset_name': change.dataset_name,
+                    'reason': conflict
+                })
+                continue
+
+            merge_rollup_deltas(rollup_deltas, change_deltas)
             change.status = 'approved'
+            approved += 1
         
+        apply_rollup_deltas(rollup_deltas)
         db.session.commit()
-        return jsonify({'success': True})
+        search_index.invalidate()
+        return jsonify({'success': True, 'approved': approved, 'conflicts': conflicts})
     
     except Exception as e:
         db.session.rollback()
@@ -430,6 +1219,91 @@ def get_audit_log():
         'changes': log.changes
     } for log in logs])
 
+@app.route('/api/rollups')
+def get_rollups():
+    """Per training stage x domain dataset counts and token sums, optionally filtered by stage"""
+    query = DatasetRollup.query
+    training_stage = request.args.get('training_stage')
+    if training_stage:
+        query = query.filter_by(training_stage=training_stage)
+    rollups = query.order_by(DatasetRollup.training_stage, DatasetRollup.domain).all()
+    return jsonify([serialize_rollup(r) for r in rollups])
+
+@app.route('/api/rollups/check')
+def check_rollups():
+    """Verify the maintained rollups against a full recompute from the datasets table"""
+    fields = ['dataset_count'] + ROLLUP_SUM_FIELDS
+    expected = compute_rollups()
+    actual = {
+        (r.training_stage, r.domain): {f: getattr(r, f) for f in fields}
+        for r in DatasetRollup.query.all()
+    }
+
+    groups = sorted(set(expected) | set(actual))
+    mismatches = []
+    for key in groups:
+        exp, act = expected.get(key), actual.get(key)
+        if exp and act and all(math.isclose(exp[f], act[f], rel_tol=1e-9, abs_tol=1e-6) for f in fields):
+            continue
+        mismatches.append({
+            'training_stage': key[0],
+            'domain': key[1],
+            'expected': exp,
+            'actual': act
+        })
+
+    return jsonify({
+        'consistent': not mismatches,
+        'groups_checked': len(groups),
+        'mismatches': mismatches
+    })
+
+@app.route('/api/rollups/rebuild', methods=['POST'])
+def rebuild_rollups_endpoint():
+    """Recompute all rollups from scratch (admin only)"""
+    data = request.json or {}
+    requested_by = data.get('requested_by', 'Admin')
+
+    # Authorization check - only the admin user can rebuild rollups
+    if requested_by != ADMIN_USER:
+        return jsonify({
+            'error': f'Unauthorized. Only {ADMIN_USER} can rebuild rollups.',
+            'unauthorized': True
+        }), 403
+
+    try:
+        rebuild_rollups()
+        return jsonify({'success': True, 'groups': DatasetRollup.query.count()})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/snapshots', methods=['GET'])
+def get_snapshots():
+    """List catalog snapshots, newest first"""
+    snapshots = CatalogSnapshot.query.order_by(CatalogSnapshot.taken_at.desc()).all()
+    return jsonify([serialize_snapshot(s) for s in snapshots])
+
+@app.route('/api/snapshots', methods=['POST'])
+def create_snapshot():
+    """Take a catalog snapshot now (admin only)"""
+    data = request.json or {}
+    requested_by = data.get('requested_by', 'Admin')
+
+    # Authorization check - only the admin user can take snapshots
+    if requested_by != ADMIN_USER:
+        return jsonify({
+            'error': f'Unauthorized. Only {ADMIN_USER} can take snapshots.',
+            'unauthorized': True
+        }), 403
+
+    try:
+        snapshot = take_snapshot()
+        return jsonify({'success': True, 'snapshot': serialize_snapshot(snapshot)})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+
 @app.route('/api/config')
 def get_config():
     """Returns configuration info including who can approve changes"""
@@ -523,6 +1397,6 @@ def delete_chart(chart_id):
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        init_db()
     port = int(os.getenv('PORT', 4000))
     app.run(debug=True, port=port, host='0.0.0.0')
\ No newline at end of file